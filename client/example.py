@@ -1,5 +1,4 @@
 from voiceBot import VoiceBot
-import numpy as np
 import asyncio
 
 async def main():
@@ -15,7 +14,7 @@ async def main():
         # Vad if no message was entered
         if not(user_input):
             print("Starting voice capture...")
-            audio_data = bot.vad.run_vad()
+            audio_data = await bot.vad.run_vad_async()
                 
             if not audio_data:
                 print("No speech detected")
@@ -33,11 +32,14 @@ async def main():
             if text_chunk:
                 print(text_chunk, end="",flush=True)
             
-            if audio_chunk and bot.audio_player:
-                audio_array = np.frombuffer(audio_chunk, dtype=np.float32)
-                bot.audio_player.write(audio_array.tobytes())
-
+            if audio_chunk:
+                await bot.play_audio(audio_chunk)
+        
+        # let the reply finish playing before listening again
+        await bot.wait_for_playback()
         print()
+    
+    await bot.close()
             
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
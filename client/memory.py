@@ -1,36 +1,91 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, BinaryIO
 from pathlib import Path
 import json
 import time
 
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    _json_loads = json.loads
+
 class Memory:
     """Conversation memory management"""
     
-    def __init__(self, memory_file: str = "conversation_memory.json", max_messages: int = 50):
+    def __init__(self, memory_file: str = "conversation_memory.jsonl", max_messages: int = 50):
         self.conversations: List[Dict[str, Any]] = []
+        self._by_context: Dict[str, List[Dict[str, str]]] = {}
         self.max_messages = max_messages
         self.memory_file = Path(memory_file)
+        self._append_file: Optional[BinaryIO] = None
+        self._lines_on_disk = 0
         self.load_memory()
     
     def load_memory(self):
-        """Load conversation history from file"""
+        """Load conversation history from file (one JSON message per line)"""
         try:
             if self.memory_file.exists():
-                with open(self.memory_file, 'r') as f:
-                    self.conversations = json.load(f)
+                conversations = []
+                with open(self.memory_file, 'rb') as f:
+                    for line in f:
+                        if line.strip():
+                            conversations.append(_json_loads(line))
+                self._lines_on_disk = len(conversations)
+                self.conversations = conversations[-self.max_messages:]
+                self._rebuild_index()
                 print(f"Loaded {len(self.conversations)} messages from memory")
         except Exception as e:
             print(f"Failed to load memory: {e}")
             self.conversations = []
+            self._by_context = {}
+    
+    def _rebuild_index(self):
+        """Rebuild the per-context message index from the history"""
+        self._by_context = {}
+        for msg in self.conversations:
+            self._by_context.setdefault(msg["context_id"], []).append(
+                {"role": msg["role"], "content": msg["content"]})
     
     def save_memory(self):
-        """Save conversation history to file"""
+        """Rewrite the whole memory file from the in-memory history"""
+        self.close()
         try:
-            with open(self.memory_file, 'w') as f:
-                json.dump(self.conversations, f, indent=2)
+            with open(self.memory_file, 'wb') as f:
+                f.write(b''.join(self._dumps(msg) for msg in self.conversations))
+            self._lines_on_disk = len(self.conversations)
         except Exception as e:
             print(f"Failed to save memory: {e}")
     
+    def _dumps(self, message: Dict[str, Any]) -> bytes:
+        """Serialize a message as one compact JSONL line"""
+        return _json_dumps(message) + b'\n'
+    
+    def _append_message(self, message: Dict[str, Any]):
+        """Append a single message to the memory file"""
+        try:
+            if self._append_file is None:
+                # Unbuffered, so every message reaches the file in a single write
+                self._append_file = open(self.memory_file, 'ab', buffering=0)
+            self._append_file.write(self._dumps(message))
+            self._lines_on_disk += 1
+        except Exception as e:
+            print(f"Failed to save memory: {e}")
+            return
+        
+        # Evicted messages stay on disk until the file is twice the cap,
+        # so the full rewrite only happens once every max_messages turns
+        if self._lines_on_disk > 2 * self.max_messages:
+            self.save_memory()
+    
+    def close(self):
+        """Close the append handle on the memory file"""
+        if self._append_file is not None:
+            self._append_file.close()
+            self._append_file = None
+    
     def add_message(self, context_id:str, role: str, content: str):
         """Add a message to conversation history"""
         message = {
@@ -40,28 +95,37 @@ class Memory:
             "timestamp": time.time()
         }
         self.conversations.append(message)
+        self._by_context.setdefault(context_id, []).append({"role": role, "content": content})
         
         # Keep only recent messages
         if len(self.conversations) > self.max_messages:
+            evicted = self.conversations[:-self.max_messages]
             self.conversations = self.conversations[-self.max_messages:]
+            for msg in evicted:
+                # The oldest message of a context is always the first in its list
+                context = self._by_context[msg["context_id"]]
+                context.pop(0)
+                if not context:
+                    del self._by_context[msg["context_id"]]
         
-        self.save_memory()
+        self._append_message(message)
     
     def get_conversation_context(self, context_id:str) -> List[Dict[str, str]]:
-        """Get conversation context for AI model"""
-        return [
-            {"role": msg["role"], "content": msg["content"]} 
-            for msg in self.conversations 
-            if msg["context_id"] == context_id
-            ]
+        """Get conversation context for AI model
+        
+        Returns the live per-context list, so callers should not modify it
+        """
+        return self._by_context.get(context_id, [])
     
     def clear_memory(self, context_id):
         """Clear all conversation history"""
         if context_id is None:
             self.conversations = []
+            self._by_context = {}
             self.save_memory()
             print("All memory cleared")
         else:
             self.conversations = [x for x in self.conversations if x["context_id"] != context_id]
+            self._by_context.pop(context_id, None)
             self.save_memory()
             print(f"Memory cleared for context id: {context_id}")
@@ -1,8 +1,17 @@
 import aiohttp
-from typing import AsyncGenerator, List, Dict
-import base64
-import io
+import asyncio
+from typing import AsyncGenerator, List, Dict, Optional
 import json
+import struct
+
+# Each TTS frame is a 4-byte little-endian length followed by PCM samples
+_FRAME_HEADER = struct.Struct('<I')
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 class ModelController:
     """Communicates with models in Docker containers"""
@@ -14,27 +23,66 @@ class ModelController:
         self.ollama_url = ollama_url
         self.stt_url = stt_url
         self.tts_url = tts_url
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def ensure_session(self) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=32, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+    
+    async def prewarm(self):
+        """Open pooled connections to every service before the first real request
+        
+        Purely advisory - failures are ignored
+        """
+        session = await self.ensure_session()
+        
+        async def ping(url: str):
+            async with session.head(url, timeout=aiohttp.ClientTimeout(total=1)):
+                pass
+        
+        await asyncio.gather(*(ping(url) for url in (self.ollama_url, self.stt_url, self.tts_url)),
+                             return_exceptions=True)
+    
+    async def aclose(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
-    async def stt_stream_response(self, audio_data: bytes) -> str:
-        """Send audio to STT service and get transcription"""
+    async def stt_stream_response(self, audio_data: bytes, sample_rate: int = 16000) -> str:
+        """Send audio to STT service and get transcription
+        
+        audio_data is raw 16-bit mono PCM (as captured by VAD) or a WAV file
+        """
         try:
-            async with aiohttp.ClientSession() as session:
+            session = await self.ensure_session()
+            
+            if audio_data[:4] == b'RIFF':
                 # Create form data with audio file
                 data = aiohttp.FormData()
                 data.add_field('file', 
-                              io.BytesIO(audio_data), 
+                              audio_data, 
                               filename='audio.wav',
                               content_type='audio/wav')
-                
-                async with session.post(f"{self.stt_url}/stt/transcribe", 
-                                      data=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result.get('text', '').strip()
-                    else:
-                        error_text = await response.text()
-                        print(f"STT Error {response.status}: {error_text}")
-                        return ""
+                request = session.post(f"{self.stt_url}/stt/transcribe", data=data)
+            else:
+                # Raw PCM goes up as-is, no WAV container or multipart framing
+                request = session.post(f"{self.stt_url}/stt/raw",
+                                       params={"rate": sample_rate, "channels": 1},
+                                       data=audio_data,
+                                       headers={"Content-Type": "application/octet-stream"})
+            
+            async with request as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return result.get('text', '').strip()
+                else:
+                    error_text = await response.text()
+                    print(f"STT Error {response.status}: {error_text}")
+                    return ""
         except Exception as e:
             print(f"STT request failed: {e}")
             return ""
@@ -42,50 +90,51 @@ class ModelController:
     async def gen_ai_stream_response(self, messages: List[Dict[str, str]], model: str = "Dan") -> AsyncGenerator[str, None]:
         """Stream response from Ollama"""
         try:
-            async with aiohttp.ClientSession() as session:
-                payload = {
-                    "model": model,
-                    "messages": messages,
-                    "stream": True
-                }
-                
-                async with session.post(f"{self.ollama_url}/api/chat",
-                                      json=payload) as response:
-                    if response.status == 200:
-                        async for line in response.content:
-                            if line.strip():
-                                try:
-                                    data = json.loads(line.decode('utf-8'))
-                                    if 'message' in data and 'content' in data['message']:
-                                        yield data['message']['content']
-                                except json.JSONDecodeError:
-                                    continue
-                    else:
-                        error_text = await response.text()
-                        print(f"Ollama Error {response.status}: {error_text}")
+            session = await self.ensure_session()
+            payload = {
+                "model": model,
+                "messages": messages,
+                "stream": True
+            }
+            
+            async with session.post(f"{self.ollama_url}/api/chat",
+                                  json=payload) as response:
+                if response.status == 200:
+                    async for line in response.content:
+                        # Skip blank lines without allocating a stripped copy
+                        if line and line[0] != 0x0a:
+                            try:
+                                data = _json_loads(line)
+                                if 'message' in data and 'content' in data['message']:
+                                    yield data['message']['content']
+                            except ValueError:
+                                continue
+                else:
+                    error_text = await response.text()
+                    print(f"Ollama Error {response.status}: {error_text}")
         except Exception as e:
             print(f"Ollama request failed: {e}")
     
     async def tts_stream_response(self, text: str) -> AsyncGenerator[bytes, None]:
-        """Stream TTS audio from text"""
+        """Stream TTS audio from text as 16-bit mono PCM at 24 kHz"""
         try:
-            async with aiohttp.ClientSession() as session:
-                payload = {"text": text}
-                
-                async with session.post(f"{self.tts_url}/tts/stream",
-                                      json=payload) as response:
-                    if response.status == 200:
-                        async for line in response.content:
-                            if line.strip():
-                                try:
-                                    # Decode base64 audio chunk
-                                    audio_b64 = line.decode('utf-8').strip()
-                                    audio_bytes = base64.b64decode(audio_b64)
-                                    yield audio_bytes
-                                except Exception:
-                                    continue
-                    else:
-                        error_text = await response.text()
-                        print(f"TTS Error {response.status}: {error_text}")
+            session = await self.ensure_session()
+            payload = {"text": text}
+            
+            async with session.post(f"{self.tts_url}/tts/stream/pcm",
+                                  json=payload) as response:
+                if response.status == 200:
+                    # Frames always hold whole samples, so each can be played as-is
+                    content = response.content
+                    while True:
+                        try:
+                            header = await content.readexactly(_FRAME_HEADER.size)
+                        except asyncio.IncompleteReadError:
+                            break  # End of stream
+                        (length,) = _FRAME_HEADER.unpack(header)
+                        yield await content.readexactly(length)
+                else:
+                    error_text = await response.text()
+                    print(f"TTS Error {response.status}: {error_text}")
         except Exception as e:
             print(f"TTS request failed: {e}")
\ No newline at end of file
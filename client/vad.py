@@ -1,12 +1,20 @@
-import wave
+import asyncio
 import webrtcvad
 import pyaudio
-from typing import List, Optional
-import io
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
 import threading
 import queue
 import time
 
+@dataclass
+class _VadState:
+    """Per-utterance speech detection state"""
+    is_active: bool = False
+    silence_count: int = 0
+    frames: bytearray = field(default_factory=bytearray)
+
 class VAD:
     """Voice Activity Detection using WebRTC VAD"""
     
@@ -15,27 +23,66 @@ class VAD:
         self.sample_rate = sample_rate
         self.frame_duration = 30  # ms
         self.frame_size = int(sample_rate * self.frame_duration / 1000)
+        self.frame_bytes = self.frame_size * 2  # 16-bit mono
         self.is_recording = False
         self.audio_buffer = []
-        self.silence_threshold = 20  # frames of silence before stopping
+        self.silence_threshold = 20  # frames of silence before ending speech
+        self.min_speech_frames = 10  # minimum frames for valid speech
+        
+        # Buffer for pre-speech audio (to catch the beginning of words)
+        self.pre_speech_buffer_size = 10
+        self.pre_speech_buffer = deque(maxlen=self.pre_speech_buffer_size)
         
-    def _frames_to_wav_bytes(self, frames: List[bytes]) -> bytes:
-        """Convert audio frames to WAV format bytes"""
-        buffer = io.BytesIO()
+        self._state = _VadState()
+    
+    def step(self, frame: bytes, is_speech: bool) -> Optional[bytearray]:
+        """
+        Advance speech detection by one frame
+        Returns the utterance as raw 16-bit mono PCM once speech ends, else None
+        """
+        state = self._state
         
-        with wave.open(buffer, 'wb') as wav_file:
-            wav_file.setnchannels(1)
-            wav_file.setsampwidth(2)  # 16-bit
-            wav_file.setframerate(self.sample_rate)
-            wav_file.writeframes(b''.join(frames))
+        if is_speech:
+            if not state.is_active:
+                # Speech just started - include pre-speech buffer
+                print("Speech detected, recording...")
+                state.is_active = True
+                state.frames = bytearray().join(self.pre_speech_buffer)  # Include lead-in
+            state.frames.extend(frame)
+            state.silence_count = 0
         
-        buffer.seek(0)
-        return buffer.read()        
+        elif state.is_active:
+            # We're in the middle of recording speech
+            state.frames.extend(frame)  # Include some trailing silence
+            state.silence_count += 1
+            
+            if state.silence_count >= self.silence_threshold:
+                print("Speech ended, processing...")
+                utterance = state.frames
+                
+                # Reset swaps in a fresh buffer, so the utterance is safe to hand off
+                self._reset_speech_detection()
+                
+                # Only return if we have enough speech frames
+                if len(utterance) >= self.min_speech_frames * self.frame_bytes:
+                    return utterance
+        
+        else:
+            # Not recording, maintain pre-speech buffer (deque drops the oldest frame)
+            self.pre_speech_buffer.append(frame)
+        
+        return None
+    
+    def _reset_speech_detection(self):
+        """Reset speech detection state"""
+        self._state = _VadState()
+        # Drop lead-in from before the last utterance so it is never replayed
+        self.pre_speech_buffer.clear()
     
-    def run_vad(self) -> bytes:
+    def run_vad(self) -> bytearray:
         """
         Capture audio with VAD and return audio data when speech ends
-        Returns raw audio bytes ready for STT
+        Returns raw 16-bit mono PCM ready for STT
         """
         audio = pyaudio.PyAudio()
         
@@ -49,46 +96,40 @@ class VAD:
             )
             
             print("Listening for speech...")
-            speech_frames = []
-            silence_count = 0
-            speech_detected = False
+            self._reset_speech_detection()
+            
+            # Bind hot-loop lookups to locals once, this runs every 30 ms
+            read = stream.read
+            vad_is_speech = self.vad.is_speech
+            step = self.step
+            sample_rate = self.sample_rate
+            frame_size = self.frame_size
             
             while True:
-                frame = stream.read(self.frame_size)
-                is_speech = self.vad.is_speech(frame, self.sample_rate)
-                
-                if is_speech:
-                    if not speech_detected:
-                        print("Speech detected, recording...")
-                        speech_detected = True
-                    speech_frames.append(frame)
-                    silence_count = 0
-                elif speech_detected:
-                    speech_frames.append(frame)  # Include some silence
-                    silence_count += 1
-                    
-                    if silence_count > self.silence_threshold:
-                        print("Speech ended, processing...")
-                        break
+                frame = read(frame_size, exception_on_overflow=False)
+                utterance = step(frame, vad_is_speech(frame, sample_rate))
+                if utterance is not None:
+                    break
                         
         finally:
             stream.stop_stream()
             stream.close()
             audio.terminate()
         
-        # Convert frames to wav bytes
-        if speech_frames:
-            return self._frames_to_wav_bytes(speech_frames)
-        return b""
+        # Raw 16-bit mono PCM at self.sample_rate, sent to STT as-is
+        return utterance
     
-class ContinuousVAD:
+    async def run_vad_async(self) -> bytearray:
+        """
+        Run run_vad in a worker thread so the event loop stays responsive
+        """
+        return await asyncio.to_thread(self.run_vad)
+    
+class ContinuousVAD(VAD):
     """Continuous Voice Activity Detection using WebRTC VAD"""
     
     def __init__(self, aggressiveness: int = 3, sample_rate: int = 16000):
-        self.vad = webrtcvad.Vad(aggressiveness)
-        self.sample_rate = sample_rate
-        self.frame_duration = 30  # ms
-        self.frame_size = int(sample_rate * self.frame_duration / 1000)
+        super().__init__(aggressiveness, sample_rate)
         
         # Threading and state management
         self.is_running = False
@@ -98,83 +139,28 @@ class ContinuousVAD:
         
         # Audio processing
         self.speech_queue = queue.Queue()
-        self.current_speech_frames = []
-        self.is_speech_active = False
-        self.silence_count = 0
-        self.silence_threshold = 20  # frames of silence before ending speech
-        self.min_speech_frames = 10  # minimum frames for valid speech
-        
-        # Buffer for pre-speech audio (to catch the beginning of words)
-        self.pre_speech_buffer = []
-        self.pre_speech_buffer_size = 10
-        
-    def _frames_to_wav_bytes(self, frames: List[bytes]) -> bytes:
-        """Convert audio frames to WAV format bytes"""
-        if not frames:
-            return b""
-            
-        buffer = io.BytesIO()
         
-        try:
-            with wave.open(buffer, 'wb') as wav_file:
-                wav_file.setnchannels(1)
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(self.sample_rate)
-                wav_file.writeframes(b''.join(frames))
-            
-            buffer.seek(0)
-            return buffer.read()
-        except Exception as e:
-            print(f"Error converting frames to WAV: {e}")
-            return b""
-    
     def _audio_processing_loop(self):
         """Main audio processing loop running in background thread"""
+        # Bind hot-loop lookups to locals once, this runs every 30 ms
+        read = self.audio_stream.read
+        vad_is_speech = self.vad.is_speech
+        step = self.step
+        sample_rate = self.sample_rate
+        frame_size = self.frame_size
+        
         try:
             while self.is_running:
                 try:
                     # Read audio frame
-                    frame = self.audio_stream.read(self.frame_size, exception_on_overflow=False)
-                    is_speech = self.vad.is_speech(frame, self.sample_rate)
+                    frame = read(frame_size, exception_on_overflow=False)
+                    utterance = step(frame, vad_is_speech(frame, sample_rate))
                     
-                    if is_speech:
-                        if not self.is_speech_active:
-                            # Speech just started - include pre-speech buffer
-                            print("Speech detected, starting recording...")
-                            self.is_speech_active = True
-                            self.current_speech_frames = list(self.pre_speech_buffer)  # Include lead-in
-                            self.silence_count = 0
-                        
-                        self.current_speech_frames.append(frame)
-                        self.silence_count = 0
-                        
-                    else:
-                        # No speech detected
-                        if self.is_speech_active:
-                            # We're in the middle of recording speech
-                            self.current_speech_frames.append(frame)  # Include some trailing silence
-                            self.silence_count += 1
-                            
-                            if self.silence_count >= self.silence_threshold:
-                                # Speech has ended
-                                print("Speech ended, queuing for processing...")
-                                
-                                # Only queue if we have enough speech frames
-                                if len(self.current_speech_frames) >= self.min_speech_frames:
-                                    wav_data = self._frames_to_wav_bytes(self.current_speech_frames)
-                                    if wav_data:
-                                        try:
-                                            self.speech_queue.put_nowait(wav_data)
-                                        except queue.Full:
-                                            print("Speech queue full, dropping audio")
-                                
-                                # Reset for next speech detection
-                                self._reset_speech_detection()
-                        else:
-                            # Not recording, maintain pre-speech buffer
-                            self.pre_speech_buffer.append(frame)
-                            if len(self.pre_speech_buffer) > self.pre_speech_buffer_size:
-                                self.pre_speech_buffer.pop(0)
+                    if utterance is not None:
+                        try:
+                            self.speech_queue.put_nowait(utterance)
+                        except queue.Full:
+                            print("Speech queue full, dropping audio")
                     
                 except Exception as e:
                     if self.is_running:  # Only log if we're still supposed to be running
@@ -186,12 +172,6 @@ class ContinuousVAD:
         finally:
             print("Audio processing loop ended")
     
-    def _reset_speech_detection(self):
-        """Reset speech detection state"""
-        self.is_speech_active = False
-        self.current_speech_frames = []
-        self.silence_count = 0
-    
     def start_listening(self):
         """Start continuous listening in background thread"""
         if self.is_running:
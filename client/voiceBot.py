@@ -1,11 +1,23 @@
 import asyncio
-import numpy as np
+import queue
+import re
+import threading
 import pyaudio
 from typing import AsyncGenerator, Tuple, Optional
 from memory import Memory
 from modelController import ModelController
 from vad import VAD
 
+# Minimum buffered characters before a clause boundary is flushed to TTS
+MIN_TTS_CHARS = 40
+
+# Split a buffer at its last sentence/clause boundary. The boundary must be
+# followed by whitespace, which holds back the tail until the next token
+# shows it is not part of something like "3.5" or "1,000"
+_SENT_RE = re.compile(r'^(.*[.!?])\s+(.*)$', re.DOTALL)
+_CLAUSE_RE = re.compile(r'^(.*[.!?,;:])\s+(.*)$', re.DOTALL)
+_TTS_PUNCT = '.!?,;:'
+
 
 class VoiceBot:
     """Main VoiceBot class orchestrating the conversation flow"""
@@ -17,24 +29,89 @@ class VoiceBot:
         self.model_name = model_name
         self.audio_player = None
         self._init_audio_player()
+        self._prewarm_task = None
+        self._start_prewarm()
+    
+    def _start_prewarm(self):
+        """Warm service connections in the background if an event loop is running"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Built outside a loop, the first request connects instead
+        self._prewarm_task = loop.create_task(self.model_controller.prewarm())
     
     def _init_audio_player(self):
         """Initialize PyAudio for audio playback"""
         self.audio = pyaudio.PyAudio()
         self.audio_player = self.audio.open(
-            format=pyaudio.paFloat32,
+            format=pyaudio.paInt16,
             channels=1,
             rate=24000,
-            output=True
+            output=True,
+            frames_per_buffer=1024
         )
+        
+        # PyAudio's write blocks, so playback runs on its own thread and the
+        # bounded queue absorbs network jitter between TTS chunks
+        self._play_queue = queue.Queue(maxsize=64)
+        self._play_thread = threading.Thread(target=self._playback_loop, daemon=True)
+        self._play_thread.start()
+    
+    def _playback_loop(self):
+        """Write queued audio to the output stream until the None sentinel"""
+        while True:
+            audio_chunk = self._play_queue.get()
+            try:
+                if audio_chunk is None:
+                    break
+                self.audio_player.write(audio_chunk)
+            except Exception as e:
+                # Keep draining so play_audio and wait_for_playback never hang
+                print(f"Error playing audio: {e}")
+            finally:
+                self._play_queue.task_done()
+    
+    async def play_audio(self, audio_chunk: bytes):
+        """Queue an audio chunk for playback without blocking the event loop"""
+        try:
+            self._play_queue.put_nowait(audio_chunk)
+        except queue.Full:
+            await asyncio.to_thread(self._play_queue.put, audio_chunk)
+    
+    async def wait_for_playback(self):
+        """Wait until every queued audio chunk has been played"""
+        await asyncio.to_thread(self._play_queue.join)
+    
+    async def close(self):
+        """Flush playback and release network and file resources held by the bot"""
+        await asyncio.to_thread(self._play_queue.put, None)
+        await asyncio.to_thread(self._play_thread.join)
+        await self.model_controller.aclose()
+        self.memory.close()
     
     def __del__(self):
         """Cleanup audio resources"""
+        play_thread = getattr(self, '_play_thread', None)
+        if play_thread and play_thread.is_alive():
+            try:
+                self._play_queue.put_nowait(None)
+            except queue.Full:
+                pass
+            play_thread.join(timeout=1.0)
         if self.audio_player:
             self.audio_player.close()
         if hasattr(self, 'audio'):
             self.audio.terminate()
     
+    def _split_tts_text(self, buffer: str) -> Tuple[str, str]:
+        """Split off the text ready for TTS, returning (ready_text, remainder)"""
+        match = _SENT_RE.match(buffer)
+        if match is None and len(buffer) > MIN_TTS_CHARS:
+            match = _CLAUSE_RE.match(buffer)
+        if match is None:
+            return "", buffer
+        return match.group(1).strip(), match.group(2)
+    
     async def ask(self, prompt: str, with_tts: bool = True, context_id: str = "general") -> AsyncGenerator[Tuple[str, Optional[bytes]], None]:
         """
         Main conversation method
@@ -60,59 +137,93 @@ class VoiceBot:
         full_response = ""
         
         if with_tts:
-            # Create queues for coordination
-            ai_queue = asyncio.Queue()
+            ai_stream = self.model_controller.gen_ai_stream_response(messages, self.model_name)
+            
+            # Sentences go to a TTS worker so synthesis overlaps generation.
+            # The audio queue is bounded to apply backpressure to TTS reads;
+            # the sentence queue is not, so queuing text can never deadlock
+            sentence_queue = asyncio.Queue()
+            audio_queue = asyncio.Queue(maxsize=32)
             
-            async def ai_generator():
-                """Generate AI response and feed to coordination queue"""
-                async for chunk in self.model_controller.gen_ai_stream_response(messages, self.model_name):
-                    if chunk.strip():
-                        await ai_queue.put(chunk)
-                await ai_queue.put(None)  # Signal end
+            async def tts_worker():
+                """Synthesize queued sentences in order and feed the audio queue"""
+                while True:
+                    sentence = await sentence_queue.get()
+                    if sentence is None:
+                        break
+                    async for audio_chunk in self.model_controller.tts_stream_response(sentence):
+                        await audio_queue.put(audio_chunk)
+                await audio_queue.put(None)  # Signal end
             
-            # Start AI generation task
-            ai_task = asyncio.create_task(ai_generator())
+            tts_task = asyncio.create_task(tts_worker())
             
             # Process chunks for both text output and TTS
             sentence_buffer = ""
+            boundary_pending = False
             
-            while True:
-                chunk = await ai_queue.get()
-                if chunk is None:
-                    # Process remaining buffer for TTS
-                    if sentence_buffer.strip():
-                        async for audio_chunk in self.model_controller.tts_stream_response(sentence_buffer):
-                            yield "", audio_chunk
-                    break
-                
-                # Yield text chunk immediately
-                full_response += chunk
-                yield chunk, None
-                
-                # Add to sentence buffer for TTS
-                sentence_buffer += chunk
-                
-                # Check if we have a complete sentence for TTS
-                if any(punct in sentence_buffer for punct in '.!?'):
-                    # Find the last sentence boundary
-                    for punct in '.!?':
-                        if punct in sentence_buffer:
-                            idx = sentence_buffer.rfind(punct) + 1
-                            sentence = sentence_buffer[:idx].strip()
-                            sentence_buffer = sentence_buffer[idx:].strip()
-                            
-                            if sentence:
-                                # Stream TTS for this sentence
-                                async for audio_chunk in self.model_controller.tts_stream_response(sentence):
-                                    yield "", audio_chunk
-                            break
+            # Wait on the next AI chunk and the next audio chunk together so each is
+            # yielded as soon as it arrives, without a task and queue hop per token
+            ai_next = asyncio.ensure_future(ai_stream.__anext__())
+            audio_get = asyncio.create_task(audio_queue.get())
+            ai_done = False
             
-            await ai_task
+            try:
+                while True:
+                    waiting = {audio_get} if ai_done else {ai_next, audio_get}
+                    done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                    
+                    if audio_get in done:
+                        audio_chunk = audio_get.result()
+                        if audio_chunk is None:
+                            # TTS only finishes after the AI stream has ended
+                            break
+                        yield "", audio_chunk
+                        audio_get = asyncio.create_task(audio_queue.get())
+                    
+                    if ai_done or ai_next not in done:
+                        continue
+                    
+                    try:
+                        chunk = ai_next.result()
+                    except StopAsyncIteration:
+                        # Process remaining buffer for TTS
+                        remainder = sentence_buffer.strip()
+                        if remainder:
+                            await sentence_queue.put(remainder)
+                        await sentence_queue.put(None)
+                        ai_done = True
+                        continue
+                    ai_next = asyncio.ensure_future(ai_stream.__anext__())
+                    
+                    if not chunk:
+                        continue
+                    
+                    # Yield text chunk immediately
+                    full_response += chunk
+                    yield chunk, None
+                    
+                    # Add to sentence buffer for TTS
+                    sentence_buffer += chunk
+                    
+                    # Only the new chunk can add a boundary, so scan just that
+                    if not boundary_pending:
+                        boundary_pending = any(punct in chunk for punct in _TTS_PUNCT)
+                    if boundary_pending:
+                        sentence, sentence_buffer = self._split_tts_text(sentence_buffer)
+                        if sentence:
+                            await sentence_queue.put(sentence)
+                            boundary_pending = any(punct in sentence_buffer for punct in _TTS_PUNCT)
+                
+                await tts_task
+            finally:
+                # Stop background work if the caller stops iterating early
+                for task in (ai_next, audio_get, tts_task):
+                    task.cancel()
             
         else:
             # Text-only mode
             async for chunk in self.model_controller.gen_ai_stream_response(messages, self.model_name):
-                if chunk.strip():
+                if chunk:
                     full_response += chunk
                     yield chunk, None
         
@@ -134,7 +245,7 @@ async def main():
         # Vad if no message was entered
         if not(user_input):
             print("Starting voice capture...")
-            audio_data = bot.vad.run_vad()
+            audio_data = await bot.vad.run_vad_async()
                 
             if not audio_data:
                 print("No speech detected")
@@ -152,11 +263,14 @@ async def main():
             if text_chunk:
                 print(text_chunk, end="",flush=True)
             
-            if audio_chunk and bot.audio_player:
-                audio_array = np.frombuffer(audio_chunk, dtype=np.float32)
-                bot.audio_player.write(audio_array.tobytes())
-
+            if audio_chunk:
+                await bot.play_audio(audio_chunk)
+        
+        # let the reply finish playing before listening again
+        await bot.wait_for_playback()
         print()
+    
+    await bot.close()
 
 
 if __name__ == "__main__":
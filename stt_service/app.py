@@ -1,7 +1,14 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-import tempfile
-import shutil
 import os
+
+# Stream-ordered CUDA allocators cut fragmentation and first-call overhead.
+# They must be set before CTranslate2/torch initialize CUDA
+os.environ.setdefault("CT2_CUDA_ALLOCATOR", "cuda_malloc_async")
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "backend:cudaMallocAsync")
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+import numpy as np
+import asyncio
+import io
 import logging
 
 # Set up logging
@@ -10,19 +17,65 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="STT Service", version="1.0.0")
 
-# Global model variable
+# Global model variable (a BatchedInferencePipeline wrapping the WhisperModel)
 model = None
 
+# Whisper model name or path; distil-large-v3 has 2 decoder layers vs 6+
+MODEL_NAME = os.getenv("STT_MODEL", "distil-large-v3")
+
+# CTranslate2 compute type; int8 weights with fp16 activations by default,
+# falling back to "auto" (fastest supported) if the GPU can't run it
+COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE", "int8_float16")
+
+# Concurrent transcriptions the model can run (one per calling thread) and
+# CPU threads for the host-side work
+NUM_WORKERS = int(os.getenv("STT_NUM_WORKERS", "4"))
+CPU_THREADS = int(os.getenv("STT_CPU_THREADS", str(os.cpu_count() or 4)))
+
+# Audio chunks decoded together in one encoder/decoder batch
+BATCH_SIZE = int(os.getenv("STT_BATCH_SIZE", "8"))
+
+# Largest upload accepted (25 MB by default), larger requests get a 413
+MAX_AUDIO_BYTES = int(os.getenv("STT_MAX_AUDIO_BYTES", str(25 * 1024 * 1024)))
+
+# Transcription language. distil-large-v3 is English-only, so pinning it skips
+# per-request language detection; set STT_LANGUAGE empty to auto-detect with
+# a multilingual model
+LANGUAGE = os.getenv("STT_LANGUAGE", "en") or None
+
+# Skip silence with Silero VAD and decode greedily for lower latency
+TRANSCRIBE_OPTIONS = {
+    "language": LANGUAGE,
+    "vad_filter": True,
+    "vad_parameters": {"min_silence_duration_ms": 500},
+    "beam_size": 1,
+    "condition_on_previous_text": False,
+}
+
 def load_model():
-    """Load the Whisper model"""
+    """Load the Whisper model wrapped in a batched inference pipeline"""
     global model
     if model is None:
         try:
-            logger.info("Loading Whisper model (base for reliability)...")
-            from faster_whisper import WhisperModel
+            logger.info(f"Loading Whisper model ({MODEL_NAME})...")
+            from faster_whisper import WhisperModel, BatchedInferencePipeline
+            
+            model_options = {
+                "device": "cuda",
+                "num_workers": NUM_WORKERS,
+                "cpu_threads": CPU_THREADS,
+            }
+            try:
+                whisper = WhisperModel(MODEL_NAME, compute_type=COMPUTE_TYPE, **model_options)
+                compute_type = COMPUTE_TYPE
+            except ValueError as e:
+                # Raised when the device does not support the requested type
+                logger.warning(f"compute_type={COMPUTE_TYPE} unsupported ({e}), using auto")
+                whisper = WhisperModel(MODEL_NAME, compute_type="auto", **model_options)
+                compute_type = "auto"
             
-            model = WhisperModel("base", compute_type="int8", device="cuda")
-            logger.info("Whisper model loaded successfully")
+            model = BatchedInferencePipeline(model=whisper)
+            logger.info(f"Whisper model loaded successfully (compute_type={compute_type})")
             
         except ImportError as e:
             logger.error(f"faster_whisper not available: {e}")
@@ -33,6 +86,65 @@ def load_model():
     
     return model
 
+@app.on_event("startup")
+async def _startup():
+    """Load the model before serving so the first request doesn't pay for it"""
+    try:
+        whisper_model = load_model()
+    except Exception as e:
+        # Keep serving; /health reports the failure and requests retry the load
+        logger.error(f"Model preload failed: {e}")
+        return
+    
+    # Run one second of silence through the underlying model (bypassing the
+    # pipeline's VAD, which would skip it) so CUDA kernels get picked now
+    try:
+        segments, _ = whisper_model.model.transcribe(np.zeros(16000, dtype=np.float32), vad_filter=False)
+        for _ in segments:
+            pass
+        logger.info("Whisper model warmed up")
+    except Exception as e:
+        logger.warning(f"Model warmup failed: {e}")
+
+def transcribe_audio(whisper_model, audio) -> dict:
+    """Transcribe an audio file object or 16 kHz float32 array and build the response body
+
+    Blocking (decode, inference and the lazy segment loop all run here), so the
+    endpoints call it with asyncio.to_thread to keep the event loop free
+    """
+    logger.info("Starting transcription...")
+    # The pipeline splits the audio into speech chunks and decodes them in batches
+    segments, info = whisper_model.transcribe(audio, batch_size=BATCH_SIZE, **TRANSCRIBE_OPTIONS)
+    
+    # Extract text from segments
+    parts = []
+    segment_count = 0
+    log_segments = logger.isEnabledFor(logging.DEBUG)
+    
+    for segment in segments:
+        segment_count += 1
+        text = segment.text.strip()
+        if text:
+            parts.append(text)
+        if log_segments:
+            logger.debug(f"Segment {segment_count}: [{segment.start:.2f}s -> {segment.end:.2f}s] {segment.text}")
+    
+    transcription_text = " ".join(parts)
+    
+    if not transcription_text:
+        logger.warning("No speech detected in audio")
+        transcription_text = ""
+    
+    logger.info(f"Transcription completed: '{transcription_text}'")
+    
+    return {
+        "text": transcription_text,
+        "language": info.language,
+        "language_probability": info.language_probability,
+        "duration": info.duration,
+        "segments": segment_count
+    }
+
 @app.post("/stt/transcribe")
 async def stt_transcribe(file: UploadFile = File(...)):
     """
@@ -43,97 +155,97 @@ async def stt_transcribe(file: UploadFile = File(...)):
     if not file:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    tmp_path = None
     try:
         # Load model
         whisper_model = load_model()
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            await file.seek(0)
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        # Reject oversized uploads before copying them into memory when the
+        # size is already known
+        if file.size is not None and file.size > MAX_AUDIO_BYTES:
+            raise HTTPException(status_code=413, detail=f"Audio file exceeds {MAX_AUDIO_BYTES} bytes")
         
-        logger.info(f"Audio saved to temporary file: {tmp_path}")
+        # Keep the upload in memory, faster_whisper decodes file-like objects directly
+        audio_bytes = await file.read()
         
         # Check file size
-        file_size = os.path.getsize(tmp_path)
+        file_size = len(audio_bytes)
         logger.info(f"Audio file size: {file_size} bytes")
         
         if file_size == 0:
             raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        if file_size > MAX_AUDIO_BYTES:
+            raise HTTPException(status_code=413, detail=f"Audio file exceeds {MAX_AUDIO_BYTES} bytes")
         
-        # Transcribe audio
-        logger.info("Starting transcription...")
-        segments, info = whisper_model.transcribe(tmp_path)
-        
-        # Extract text from segments
-        transcription_text = ""
-        segment_count = 0
-        
-        for segment in segments:
-            segment_count += 1
-            transcription_text += segment.text.strip() + " "
-            logger.info(f"Segment {segment_count}: [{segment.start:.2f}s -> {segment.end:.2f}s] {segment.text}")
-        
-        # Clean up final text
-        transcription_text = transcription_text.strip()
-        
-        if not transcription_text:
-            logger.warning("No speech detected in audio file")
-            transcription_text = ""
-        
-        logger.info(f"Transcription completed: '{transcription_text}'")
-        
-        return {
-            "text": transcription_text,
-            "language": info.language,
-            "language_probability": info.language_probability,
-            "duration": info.duration,
-            "segments": segment_count,
-            "file_info": {
-                "filename": file.filename,
-                "size": file_size
-            }
+        result = await asyncio.to_thread(transcribe_audio, whisper_model, io.BytesIO(audio_bytes))
+        result["file_info"] = {
+            "filename": file.filename,
+            "size": file_size
         }
+        return result
     
     except HTTPException:
         raise  # Re-raise HTTP exceptions as-is
     except Exception as e:
         logger.error(f"STT processing failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"STT processing failed: {str(e)}")
+
+@app.post("/stt/raw")
+async def stt_raw(request: Request, rate: int = 16000, channels: int = 1):
+    """
+    Transcribe raw 16-bit little-endian PCM sent as the request body
+    """
+    # Fail fast on a declared oversized body before buffering it; chunked
+    # bodies have no length and are checked after the read
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_AUDIO_BYTES:
+        raise HTTPException(status_code=413, detail=f"Audio exceeds {MAX_AUDIO_BYTES} bytes")
     
-    finally:
-        # Clean up temporary file
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-                logger.info("Temporary file cleaned up")
-            except Exception as e:
-                logger.warning(f"Failed to clean up temporary file: {e}")
-                
+    pcm = await request.body()
+    logger.info(f"Received raw transcription request: {len(pcm)} bytes, {rate} Hz, {channels} channel(s)")
+    
+    if not pcm:
+        raise HTTPException(status_code=400, detail="Request body is empty")
+    if len(pcm) > MAX_AUDIO_BYTES:
+        raise HTTPException(status_code=413, detail=f"Audio exceeds {MAX_AUDIO_BYTES} bytes")
+    if rate != 16000:
+        raise HTTPException(status_code=400, detail="Raw PCM must be sampled at 16000 Hz")
+    if channels < 1 or len(pcm) % (2 * channels):
+        raise HTTPException(status_code=400, detail="Raw PCM length does not match 16-bit samples")
+    
+    try:
+        whisper_model = load_model()
+        
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        if channels > 1:
+            audio = audio.reshape(-1, channels).mean(axis=1)
+        
+        return await asyncio.to_thread(transcribe_audio, whisper_model, audio)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"STT processing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"STT processing failed: {str(e)}")
+
 @app.get("/")
 async def root():
-    return {"message": "STT Service is running", "model": "base"}
+    return {"message": "STT Service is running", "model": MODEL_NAME}
 
 @app.get("/health")
 async def health_check():
-    try:
-        # Try to load model to check if everything is working
-        model_instance = load_model()
-        model_loaded = model_instance is not None
-        
-        return {
-            "status": "healthy",
-            "service": "stt", 
-            "model_loaded": model_loaded,
-            "model_type": "base"
-        }
-    except Exception as e:
+    # The model is preloaded at startup, so just report whether that worked
+    if model is None:
         return {
             "status": "unhealthy", 
-            "error": str(e)
+            "error": "Model not loaded"
         }
+    
+    return {
+        "status": "healthy",
+        "service": "stt", 
+        "model_loaded": True,
+        "model_type": MODEL_NAME
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,30 +1,177 @@
-from fastapi import FastAPI, Request
+import os
+
+# Stream-ordered CUDA allocator cuts fragmentation and first-call overhead.
+# It must be set before torch initializes CUDA
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "backend:cudaMallocAsync")
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from kokoro import KPipeline
 import numpy as np
-import base64
+import binascii
+import json
+import logging
+import re
+import struct
+import threading
+import torch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
-pipeline = KPipeline(lang_code="a", device="cuda") # yeilds tuple(gs, ps, audio)
 
-def synthesize_sentence(sentence: str, voice="af_heart"):
+# "torch" runs Kokoro in PyTorch; "onnx" runs a model exported with
+# export_onnx.py through ONNX Runtime (TensorRT fp16, then CUDA) and keeps
+# KPipeline for text-to-phoneme only
+BACKEND = os.getenv("TTS_BACKEND", "torch")
+ONNX_PATH = os.getenv("TTS_ONNX_PATH", "kokoro.onnx")
+
+# Built TensorRT engines are cached here so restarts skip the engine build
+TRT_CACHE_PATH = os.getenv("TTS_TRT_CACHE_PATH", "trt_cache")
+
+def _load_onnx_session():
+    import onnxruntime as ort
+
+    # One profile spans every phoneme length Kokoro accepts (510 + 2 pad
+    # tokens), so no sentence length forces an engine rebuild mid-request
+    trt_options = {
+        "trt_fp16_enable": True,
+        "trt_profile_min_shapes": "input_ids:1x2",
+        "trt_profile_opt_shapes": "input_ids:1x128",
+        "trt_profile_max_shapes": "input_ids:1x512",
+        "trt_engine_cache_enable": True,
+        "trt_engine_cache_path": TRT_CACHE_PATH,
+    }
+    providers = [
+        ("TensorrtExecutionProvider", trt_options),
+        "CUDAExecutionProvider",
+        "CPUExecutionProvider",
+    ]
+    available = ort.get_available_providers()
+    providers = [p for p in providers if (p[0] if isinstance(p, tuple) else p) in available]
+    return ort.InferenceSession(ONNX_PATH, providers=providers)
+
+def _load_vocab():
+    """Phoneme-to-id map from the Kokoro config (KModel reads the same file)"""
+    from huggingface_hub import hf_hub_download
+
+    with open(hf_hub_download(repo_id="hexgrad/Kokoro-82M", filename="config.json")) as f:
+        return json.load(f)["vocab"]
+
+if BACKEND == "onnx":
+    pipeline = KPipeline(lang_code="a", model=False) # text-to-phoneme only, results carry no audio
+    onnx_session = _load_onnx_session()
+    onnx_vocab = _load_vocab()
+else:
+    pipeline = KPipeline(lang_code="a", device="cuda") # yeilds tuple(gs, ps, audio)
+    onnx_session = None
+
+SAMPLE_RATE = 24000  # Kokoro output rate
+
+# Samples per streamed chunk (250 ms). A segment is fully synthesized before
+# it is chunked, so bigger chunks cost no latency and mean fewer yields
+CHUNK_SAMPLES = SAMPLE_RATE // 4
+
+# Sentence ends, so multi-sentence text can be fed to Kokoro one line per sentence
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Streams are driven from threadpool workers; one segment synthesizes at a time
+_synth_lock = threading.Lock()
+
+def _onnx_synthesize(phonemes: str, voice_pack: torch.Tensor) -> np.ndarray:
+    """Run the exported model on one segment's phonemes, mirroring KModel.forward"""
+    input_ids = [i for i in map(onnx_vocab.get, phonemes) if i is not None]
+    waveform, _ = onnx_session.run(None, {
+        "input_ids": np.array([[0, *input_ids, 0]], dtype=np.int64),
+        "ref_s": voice_pack[len(phonemes) - 1].numpy(),
+        "speed": np.array([1.0], dtype=np.float32),
+    })
+    return waveform
+
+def _iter_segments(text: str, voice="af_heart"):
+    """Yield each Kokoro audio segment as a numpy array"""
+    # split_pattern breaks on newlines, so one sentence becomes one segment
+    # and the first sentence streams without waiting on the rest
     generator = pipeline(
-        sentence,
+        "\n".join(_SENTENCE_SPLIT_RE.split(text)),
         voice=voice,
         speed=1,
         split_pattern="\n+"
     )
-    audio_segments = [audio for _, _, audio in generator]
-    if not audio_segments:
-        return np.zeros(0, dtype="float32")
+    voice_pack = pipeline.load_voice(voice) if onnx_session is not None else None
+    while True:
+        # Enter inference mode per segment so it is not left active on this
+        # thread while the caller holds the generator suspended
+        with _synth_lock, torch.inference_mode():
+            result = next(generator, None)
+            if result is None:
+                return
+            if onnx_session is not None:
+                audio = _onnx_synthesize(result.phonemes, voice_pack)
+            else:
+                audio = result.audio
 
-    audio = np.concatenate(audio_segments).astype("float32")
+        if audio is not None:
+            yield np.asarray(audio)
 
+def _to_mono_numpy(audio: np.ndarray) -> np.ndarray:
+    """Return a segment as mono float32"""
+    audio = audio.astype(np.float32, copy=False)
+
+    # Kokoro/ORT return 1-D host audio; the downmix is a safeguard
     if audio.ndim > 1:
         audio = np.mean(audio, axis=1)
 
     return audio
 
+def iter_audio(text: str, voice="af_heart"):
+    """Yield mono float32 audio for each segment as soon as Kokoro produces it"""
+    for audio in _iter_segments(text, voice):
+        yield _to_mono_numpy(audio)
+
+def synthesize_sentence(sentence: str, voice="af_heart"):
+    audio_segments = list(_iter_segments(sentence, voice))
+    if not audio_segments:
+        return np.zeros(0, dtype="float32")
+
+    return _to_mono_numpy(np.concatenate(audio_segments))
+
+
+@app.on_event("startup")
+async def warmup():
+    """Run one synthesis so CUDA kernel selection happens before the first request"""
+    try:
+        synthesize_sentence("Warm up.")
+        logger.info("Kokoro warmed up")
+    except Exception as e:
+        logger.warning(f"Warmup failed: {e}")
+
+
+async def _read_text(request: Request) -> str:
+    """Text to speak from a {"text": "..."} body, stripped"""
+    body = await request.json()
+    return body.get("text", "").strip()
+
+def _to_pcm16(audio: np.ndarray) -> np.ndarray:
+    """int16 is transparent for speech and halves the bytes on the wire"""
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+def _iter_pcm_chunks(text: str, convert=None):
+    """Yield byte views of CHUNK_SAMPLES-sample chunks, shipping each segment as soon as it is synthesized
+
+    A plain generator: StreamingResponse iterates it in the threadpool, so
+    synthesis and encoding never block the event loop. Chunks are sliced from
+    a byte view of the samples instead of being copied
+    """
+    for audio in iter_audio(text):
+        if convert is not None:
+            audio = convert(audio)
+        chunk_bytes = CHUNK_SAMPLES * audio.itemsize
+        mv = memoryview(audio).cast("B")
+        for i in range(0, len(mv), chunk_bytes):
+            yield mv[i:i+chunk_bytes]
+
 
 @app.post("/tts/stream")
 async def tts_stream(request: Request):
@@ -32,19 +179,30 @@ async def tts_stream(request: Request):
     Input: {"text":"..."}
     Output: newline-delimited base64 PCM float32 chunks
     """
-    body = await request.json()
-    text = body.get("text", "").strip()
+    text = await _read_text(request)
     if not text:
         return {"error": "No text provided"}
 
-    audio = synthesize_sentence(text)
+    # b2a_base64 appends the newline in the same allocation
+    lines = (binascii.b2a_base64(chunk) for chunk in _iter_pcm_chunks(text))
+    return StreamingResponse(lines, media_type="application/octet-stream")
 
-    async def pcm_gen():
-        CHUNK = 4096
-        for i in range(0, len(audio), CHUNK):
-            chunk = audio[i:i+CHUNK]
-            yield (
-                base64.b64encode(chunk.tobytes()).decode("utf-8") + "\n"
-            )
 
-    return StreamingResponse(pcm_gen(), media_type="application/octet-stream")
\ No newline at end of file
+@app.post("/tts/stream/pcm")
+async def tts_stream_pcm(request: Request):
+    """
+    Input: {"text":"..."}
+    Output: length-prefixed frames of raw PCM int16 mono at 24 kHz,
+            each a 4-byte little-endian length followed by whole samples
+    """
+    text = await _read_text(request)
+    if not text:
+        # A JSON error body would be misread as a frame length
+        raise HTTPException(status_code=400, detail="No text provided")
+
+    frames = (struct.pack("<I", len(chunk)) + chunk for chunk in _iter_pcm_chunks(text, _to_pcm16))
+    return StreamingResponse(
+        frames,
+        media_type="application/octet-stream",
+        headers={"X-Audio-Format": "s16le", "X-Sample-Rate": str(SAMPLE_RATE)}
+    )
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""One-time export of Kokoro's acoustic model + vocoder to ONNX
+
+Run inside the tts_service image, then start it with TTS_BACKEND=onnx:
+    python export_onnx.py [output_path]
+"""
+import sys
+
+import torch
+from kokoro import KModel
+from kokoro.model import KModelForONNX
+
+def export(output_path="kokoro.onnx"):
+    # disable_complex swaps the complex STFT for an ONNX-exportable one
+    model = KModelForONNX(KModel(disable_complex=True)).eval()
+
+    input_ids = torch.randint(1, 100, (1, 32), dtype=torch.long)
+    ref_s = torch.randn(1, 256)
+    speed = torch.tensor([1.0])
+
+    torch.onnx.export(
+        model,
+        (input_ids, ref_s, speed),
+        output_path,
+        input_names=["input_ids", "ref_s", "speed"],
+        output_names=["waveform", "duration"],
+        dynamic_axes={
+            "input_ids": {1: "num_tokens"},
+            "waveform": {0: "num_samples"},
+            "duration": {0: "num_tokens"},
+        },
+        opset_version=17,
+        # The TorchScript exporter; newer torch defaults to the dynamo one,
+        # which needs onnxscript and handles dynamic_axes differently
+        dynamo=False,
+    )
+    print(f"Exported Kokoro to {output_path}")
+
+if __name__ == "__main__":
+    export(*sys.argv[1:2])